@@ -0,0 +1,274 @@
+"""DNS and SMTP checks shared by the Streamlit app and the CSV scanner."""
+
+import dns.resolver
+import dns.entropy
+import dns.exception
+import dns.flags
+import dns.inet
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
+import socket
+import smtplib
+import time
+from collections import deque
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor
+
+# --- THE BRUTE FORCE DICTIONARY ---
+# This list covers 99% of global and private host selectors
+ULTIMATE_SELECTORS = [
+    'selector1', 'selector2', 'google', 'default', 'mail', 'k1', 'k2', 'k3', 
+    'sig1', 's1', 's2', 'smtp', 'zoho', 'mandrill', 'm1', 'm2', 'picasso', 
+    'amazonses', 'sendgrid', 'hubspot', 'mailgun', 'dkim', 'ms', 'onms',
+    'hostinger', 'hostinger1', 'hostinger2', 'cp01', 'cp02', 'key1', 'key2'
+]
+
+# One resolver for every worker thread: avoids re-parsing resolv.conf per lookup
+# and lets repeated MX/SPF/DMARC answers come straight from the cache. The DKIM
+# sweep below only borrows its nameservers and timeouts; its results are
+# memoized per domain by get_dns_data instead.
+_RESOLVER = dns.resolver.Resolver()
+_RESOLVER.timeout = 2
+_RESOLVER.lifetime = 2
+_RESOLVER.cache = dns.resolver.LRUCache(10000)
+
+# Lookup failures that just mean "no usable record" right now. The transient
+# ones may well succeed on the next try, so results built on them are never
+# memoized. Anything else is a bug and should surface as a Scan Error rather
+# than be swallowed.
+NO_RECORD_ERRORS = (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer)
+TRANSIENT_ERRORS = (dns.resolver.NoNameservers, dns.exception.Timeout)
+
+class Transient(Exception):
+    """Raised by a @memoize function to return `result` without caching it."""
+    def __init__(self, result):
+        self.result = result
+
+def memoize(maxsize):
+    """lru_cache that skips results built on transient lookup failures.
+
+    The caches live as long as the process (for Streamlit, the server), so a
+    DNS blip must not outlive the run it happened in. lru_cache never caches a
+    call that raised, so the wrapped function raises Transient(result) instead
+    of returning such a result.
+    """
+    def decorator(func):
+        cached = lru_cache(maxsize=maxsize)(func)
+
+        @wraps(func)
+        def wrapper(*args):
+            try:
+                return cached(*args)
+            except Transient as e:
+                return e.result
+        wrapper.cache_info = cached.cache_info
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+    return decorator
+
+# The selector sweep is a burst of 31 TXT queries. Instead of a socket per
+# lookup, they are all written back to back on one UDP socket and the replies
+# are matched by transaction ID and question.
+DKIM_PREFIXES = [f"{selector}._domainkey." for selector in ULTIMATE_SELECTORS]
+
+def _txt_answer(response):
+    # "No such selector" is the common case, so it is a plain None rather than
+    # an exception object.
+    if response.rcode() == dns.rcode.NXDOMAIN:
+        return None
+    for rrset in response.answer:
+        if rrset.rdtype == dns.rdatatype.TXT:
+            return rrset
+    return None
+
+def _sweep(nameserver, port, pending, answers, deadline):
+    """Sends every pending query to one nameserver and collects replies until
+    all are answered or the deadline passes. Answered queries leave `pending`;
+    ones this server failed (REFUSED, SERVFAIL, broken TCP retry) stay in it
+    for the next nameserver, with the failure recorded in case none answers.
+    """
+    failed = {}
+    try:
+        sock = socket.socket(dns.inet.af_for_address(nameserver), socket.SOCK_DGRAM)
+    except (OSError, ValueError) as e:
+        for i, _ in pending.values(): answers[i] = e
+        return
+    # A fresh socket per sweep gets a fresh random source port, and connecting
+    # it makes the kernel drop datagrams from anyone but this nameserver.
+    with sock:
+        try:
+            sock.connect((nameserver, port))
+            for _, query in pending.values():
+                sock.send(query.to_wire())
+        except OSError as e:
+            for i, _ in pending.values(): answers[i] = e
+            return
+
+        resend_at = time.monotonic() + (deadline - time.monotonic()) / 2
+        while pending:
+            now = time.monotonic()
+            if now >= deadline: break
+            try:
+                if resend_at and now >= resend_at:
+                    for _, query in pending.values():
+                        sock.send(query.to_wire())
+                    resend_at = None
+                sock.settimeout((resend_at or deadline) - now)
+                wire = sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                # e.g. ICMP port unreachable: this server is no use, move on.
+                for i, _ in pending.values(): answers[i] = e
+                break
+            try:
+                response = dns.message.from_wire(wire)
+            except dns.exception.DNSException:
+                continue
+            entry = pending.get(response.id)
+            if entry is None or not entry[1].is_response(response):
+                continue
+            i, query = failed[response.id] = pending.pop(response.id)
+            if response.flags & dns.flags.TC:
+                try:
+                    response = dns.query.tcp(query, nameserver, timeout=max(deadline - now, 0.1), port=port)
+                except (dns.exception.DNSException, OSError) as e:
+                    answers[i] = e
+                    continue
+            if response.rcode() not in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+                answers[i] = dns.resolver.NoNameservers()
+                continue
+            del failed[query.id]
+            answers[i] = _txt_answer(response)
+    pending.update(failed)
+
+def scan_dkim(domain, prefixes=DKIM_PREFIXES):
+    """Queries every selector prefix at once over UDP.
+
+    Returns one entry per selector: the TXT rrset, None if the selector has no
+    record, or an (unraised) exception if the lookup itself failed. Each
+    configured nameserver in turn gets an equal share of the resolver lifetime
+    for whatever is still unanswered; within that share unanswered queries are
+    resent once, and truncated replies are retried over TCP.
+    """
+    answers = [dns.resolver.LifetimeTimeout(timeout=_RESOLVER.lifetime, errors=[])] * len(prefixes)
+    pending = {}
+    for i, prefix in enumerate(prefixes):
+        try:
+            query = dns.message.make_query(prefix + domain, "TXT", use_edns=0, payload=1232)
+        except dns.exception.DNSException as e:
+            # Not even a valid name (empty label, label over 63 octets, ...).
+            answers[i] = e
+            continue
+        while query.id in pending:
+            query.id = dns.entropy.random_16()
+        pending[query.id] = (i, query)
+
+    nameservers = _RESOLVER.nameservers
+    share = _RESOLVER.lifetime / len(nameservers)
+    for nameserver in nameservers:
+        if not pending: break
+        _sweep(nameserver, _RESOLVER.port, pending, answers, time.monotonic() + share)
+    return answers
+
+@memoize(maxsize=4096)
+def get_dns_data(domain):
+    """Accurate DNS Audit using Brute-Force Selector Dictionary.
+
+    Results are memoized per domain, so treat the returned dict as read-only.
+    Results touched by a timeout or a failing nameserver have "transient" set
+    and are recomputed next time.
+    """
+    res = {
+        "mx": "FAIL", "spf": "FAIL", "dkim": "FAIL", 
+        "dmarc": "FAIL", "server": "Unknown", "dkim_report": "No Selector Match",
+        "mx_host": None, "transient": False
+    }
+
+    try:
+        # 1. MX & Server Identification
+        try:
+            mx_query = _RESOLVER.resolve(domain, "MX", raise_on_no_answer=False)
+            if mx_query.rrset is not None:
+                res["mx"] = "PASS"
+                primary_mx = str(mx_query[0].exchange).lower()
+                res["mx_host"] = primary_mx
+                if "google" in primary_mx: res["server"] = "Google Workspace"
+                elif "outlook" in primary_mx or "microsoft" in primary_mx: res["server"] = "Microsoft 365"
+                else: res["server"] = "Private SMTP"
+        except NO_RECORD_ERRORS: pass
+        except TRANSIENT_ERRORS: res["transient"] = True
+        # No mail server: the TXT checks can't change the verdict, skip them.
+        if res["mx"] == "FAIL":
+            res["dkim_report"] = "Skipped (No MX)"
+            if res["transient"]: raise Transient(res)
+            return res
+
+        # The remaining lookups are independent, so send them together and pay
+        # roughly one round trip instead of the sum of 33.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            spf_future = pool.submit(_RESOLVER.resolve, domain, "TXT", raise_on_no_answer=False)
+            dmarc_future = pool.submit(_RESOLVER.resolve, f"_dmarc.{domain}", "TXT", raise_on_no_answer=False)
+            dkim_answers = scan_dkim(domain)
+
+            # 2. SPF & DMARC Checks
+            try:
+                txt_records = spf_future.result()
+                if any("v=spf1" in str(r) for r in txt_records): res["spf"] = "PASS"
+            except NO_RECORD_ERRORS: pass
+            except TRANSIENT_ERRORS: res["transient"] = True
+            try:
+                if dmarc_future.result().rrset is not None: res["dmarc"] = "PASS"
+            except NO_RECORD_ERRORS: pass
+            except TRANSIENT_ERRORS: res["transient"] = True
+
+            # 3. DKIM Brute-Force Scan: first selector in dictionary order wins
+            for selector, answer in zip(ULTIMATE_SELECTORS, dkim_answers):
+                if answer is None:
+                    continue
+                if isinstance(answer, dns.exception.Timeout):
+                    res["dkim_report"] = "DNS Timeout"
+                    res["transient"] = True
+                    continue
+                if isinstance(answer, Exception): raise answer
+                res["dkim"] = f"PASS ({selector})"
+                res["dkim_report"] = f"Match Found: {selector}"
+                break
+    except Transient:
+        raise
+    except Exception as e:
+        res["dkim_report"] = f"Scan Error: {str(e)[:15]}"
+        res["transient"] = True
+    if res["transient"]: raise Transient(res)
+    return res
+
+def check_smtp(emails, mx_host, server):
+    """Probes all addresses served by one MX host over a single SMTP session.
+
+    Returns {email: status}. If the session drops mid-batch, the address being
+    probed stays UNVERIFIABLE and a new session picks up the rest.
+    """
+    if any(x in server for x in ["Google", "Microsoft"]):
+        return {email: "PROTECTED" for email in emails}
+    results = {email: "UNVERIFIABLE" for email in emails}
+    # No MX record: nothing to connect to, don't wait out a doomed handshake.
+    if mx_host is None: return results
+
+    pending = deque(emails)
+    while pending:
+        email = None
+        try:
+            with smtplib.SMTP(mx_host, timeout=3) as smtp:
+                smtp.helo(socket.gethostname())
+                while pending:
+                    email = pending.popleft()
+                    smtp.mail('verify@test.com')
+                    code, _ = smtp.rcpt(email)
+                    results[email] = "AVAILABLE" if code == 250 else "NOT_FOUND"
+                    smtp.rset()
+        except (smtplib.SMTPException, OSError, UnicodeError):
+            # Never reached RCPT: the host won't talk to us, so stop retrying.
+            if email is None: break
+    return results
@@ -1,13 +1,26 @@
 import pandas as pd
-import dns.resolver
+import csv
 import os
+import re
 import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
+from dns_audit import Transient, memoize, scan_dkim
 
 # --- CONFIGURATION ---
 INPUT_FILE = "BOOK1.csv"
 OUTPUT_FILE = "DKIM_FINAL_REPORT.csv"
 
+# The scan is almost entirely DNS wait time, so many more lookups can be
+# in flight than there are CPU cores.
+MAX_WORKERS = 100
+
+# Rows read from the input per batch; peak memory scales with this, not the file.
+CHUNK_SIZE = 10000
+
+# Rows that don't even look like an address are reported without a DNS scan.
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
 # These are the "keys" used to find DKIM. 
 # Added 'selector1' and 'selector2' at the top for Microsoft 365.
 SELECTORS = [
@@ -15,63 +28,89 @@ SELECTORS = [
     'default', 'mail', 'k1', 'picasso', 'mandrill'
 ]
 
-def get_dkim_data(email):
+# Selector prefixes for the shared pipelined sweep in dns_audit; the first one
+# in SELECTORS order holding a real DKIM record wins.
+DKIM_PREFIXES = [f"{s}._domainkey." for s in SELECTORS]
+
+@memoize(maxsize=4096)
+def lookup_dkim(domain):
+    """
+    Runs the selector scan for one domain.
+    Returns a (status, report) tuple; memoized per domain unless a lookup failed.
     """
-    Looks up DKIM records and returns a dictionary.
+    report = "No Selector Match"
+    answers = scan_dkim(domain, DKIM_PREFIXES)
+    for s, answer in zip(SELECTORS, answers):
+        if answer is None:
+            continue
+        if isinstance(answer, Exception):
+            report = f"Error: {type(answer).__name__}"
+            continue
+        for rdata in answer:
+            record = rdata.to_text()
+            if "v=DKIM1" in record or "p=" in record:
+                return f"PASS ({s})", "Record Found Successfully"
+
+    if report != "No Selector Match":
+        raise Transient(("FAIL", report))
+    return "FAIL", report
+
+def get_dkim_data(email, dkim):
+    """
+    Builds the report row for one email from its domain's (status, report).
     This structure ensures every row has the same columns.
     """
-    domain = str(email).split('@')[-1].strip()
-    result = {
+    status, report = dkim
+    return {
         "EMAIL": email,
-        "DKIM_STATUS": "FAIL",
-        "DKIM_REPORT": "No Selector Match", # This is your missing column
+        "DKIM_STATUS": status,
+        "DKIM_REPORT": report, # This is your missing column
         "SCAN_TIME": time.strftime("%H:%M:%S")
     }
 
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = 2
-    resolver.lifetime = 2
-
-    for s in SELECTORS:
-        try:
-            path = f"{s}._domainkey.{domain}"
-            query = resolver.resolve(path, "TXT")
-            for rdata in query:
-                record = rdata.to_text()
-                if "v=DKIM1" in record or "p=" in record:
-                    result["DKIM_STATUS"] = f"PASS ({s})"
-                    result["DKIM_REPORT"] = "Record Found Successfully"
-                    return result
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-            continue 
-        except Exception as e:
-            result["DKIM_REPORT"] = f"Error: {type(e).__name__}"
-            break
-            
-    return result
-
 def main():
     if not os.path.exists(INPUT_FILE):
         print(f"Error: {INPUT_FILE} not found!")
         return
 
     print("Step 1: Loading emails...")
-    df_in = pd.read_csv(INPUT_FILE)
-    email_list = df_in.iloc[:, 0].dropna().tolist()
+    # The input is read CHUNK_SIZE rows at a time. Each chunk's new domains are
+    # queued for scanning before the previous chunk is written out, so the
+    # workers stay busy while rows are streamed to the report.
+    chunks = pd.read_csv(
+        INPUT_FILE, usecols=[0], dtype="string", engine="c", chunksize=CHUNK_SIZE
+    )
+    scans = {}
+    pending = deque()
+    total = 0
 
-    print(f"Step 2: Scanning {len(email_list)} emails for DKIM...")
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        audit_results = list(executor.map(get_dkim_data, email_list))
+    print("Step 2: Scanning emails for DKIM...")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+            open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
+        # Fixed column order: DKIM_REPORT is the third column so you can't miss it
+        writer = csv.DictWriter(f, fieldnames=["EMAIL", "DKIM_STATUS", "DKIM_REPORT", "SCAN_TIME"])
+        writer.writeheader()
 
-    print("Step 3: Forcing column generation...")
-    df_out = pd.DataFrame(audit_results)
+        def write_chunk(emails, domains, well_formed):
+            for e, d, ok in zip(emails, domains, well_formed):
+                dkim = scans[d].result() if ok else ("FAIL", "Invalid Email Format")
+                writer.writerow(get_dkim_data(e, dkim))
 
-    # REORDERING: This forces DKIM_REPORT to be the third column so you can't miss it
-    df_out = df_out[["EMAIL", "DKIM_STATUS", "DKIM_REPORT", "SCAN_TIME"]]
+        for chunk in chunks:
+            emails = chunk.iloc[:, 0].dropna().str.strip()
+            well_formed = emails.str.match(EMAIL_RE)
+            domains = emails.str.rpartition('@', expand=False).str[2].str.lower()
+            for d in domains[well_formed].unique():
+                if d not in scans:
+                    scans[d] = executor.submit(lookup_dkim, d)
+            pending.append((emails, domains, well_formed))
+            total += len(emails)
+            if len(pending) > 1:
+                write_chunk(*pending.popleft())
+        while pending:
+            write_chunk(*pending.popleft())
 
-    # Save to a completely new file
-    df_out.to_csv(OUTPUT_FILE, index=False)
-    
+    print(f"Step 3: Scanned {len(scans)} domains ({total} emails).")
     print("-" * 30)
     print(f"SUCCESS! New report created: {OUTPUT_FILE}")
     print(f"Location: {os.path.abspath(OUTPUT_FILE)}")
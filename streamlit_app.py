@@ -1,133 +1,154 @@
 import streamlit as st
 import pandas as pd
-import dns.resolver
+import numpy as np
 import socket
-import smtplib
+import io
 import re
+from collections import defaultdict
+from functools import lru_cache, partial
 from email_validator import validate_email, EmailNotValidError
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dns_audit import Transient, get_dns_data, check_smtp
 
 # --- PAGE SETUP ---
 st.set_page_config(page_title="Mailmeter Pro - Max Accuracy", layout="wide", page_icon="📧")
 socket.setdefaulttimeout(10)
 
-# --- THE BRUTE FORCE DICTIONARY ---
-# This list covers 99% of global and private host selectors
-ULTIMATE_SELECTORS = [
-    'selector1', 'selector2', 'google', 'default', 'mail', 'k1', 'k2', 'k3', 
-    'sig1', 's1', 's2', 'smtp', 'zoho', 'mandrill', 'm1', 'm2', 'picasso', 
-    'amazonses', 'sendgrid', 'hubspot', 'mailgun', 'dkim', 'ms', 'onms',
-    'hostinger', 'hostinger1', 'hostinger2', 'cp01', 'cp02', 'key1', 'key2'
-]
-
-def get_dns_data(domain):
-    """Accurate DNS Audit using Brute-Force Selector Dictionary."""
-    res = {
-        "mx": "FAIL", "spf": "FAIL", "dkim": "FAIL", 
-        "dmarc": "FAIL", "server": "Unknown", "dkim_report": "No Selector Match"
-    }
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = 2
-    resolver.lifetime = 2
-    
-    try:
-        # 1. MX & Server Identification
-        try:
-            mx_query = resolver.resolve(domain, "MX")
-            res["mx"] = "PASS"
-            primary_mx = str(mx_query[0].exchange).lower()
-            if "google" in primary_mx: res["server"] = "Google Workspace"
-            elif "outlook" in primary_mx or "microsoft" in primary_mx: res["server"] = "Microsoft 365"
-            else: res["server"] = "Private SMTP"
-        except: res["mx"] = "FAIL"
-
-        # 2. SPF & DMARC Checks
-        try:
-            txt_records = resolver.resolve(domain, "TXT")
-            if any("v=spf1" in str(r) for r in txt_records): res["spf"] = "PASS"
-        except: pass
-        try:
-            resolver.resolve(f"_dmarc.{domain}", "TXT")
-            res["dmarc"] = "PASS"
-        except: pass
-
-        # 3. DKIM Brute-Force Scan
-        for selector in ULTIMATE_SELECTORS:
-            try:
-                path = f"{selector}._domainkey.{domain}"
-                resolver.resolve(path, "TXT")
-                res["dkim"] = f"PASS ({selector})"
-                res["dkim_report"] = f"Match Found: {selector}"
-                return res 
-            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-                continue
-            except dns.resolver.Timeout:
-                res["dkim_report"] = "DNS Timeout"
-                break
-    except Exception as e:
-        res["dkim_report"] = f"Scan Error: {str(e)[:15]}"
-    return res
-
-def check_smtp(email, domain, server):
-    if any(x in server for x in ["Google", "Microsoft"]): return "PROTECTED"
+# Workers spend nearly all their time waiting on DNS/SMTP, so keep plenty in flight.
+MAX_WORKERS = 100
+
+# Cheap shape check run over the whole column at once; the domain half of each
+# survivor is then validated once per distinct domain.
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+@lru_cache(maxsize=4096)
+def validate_domain(domain):
+    """Returns the normalized (IDNA) domain, or None if it can't receive mail.
+
+    A placeholder mailbox is used so only the domain is checked; the local part
+    is covered by EMAIL_RE.
+    """
     try:
-        mx_records = dns.resolver.resolve(domain, 'MX')
-        mx_host = str(mx_records[0].exchange)
-        with smtplib.SMTP(mx_host, timeout=3) as smtp:
-            smtp.helo(socket.gethostname())
-            smtp.mail('verify@test.com')
-            code, _ = smtp.rcpt(email)
-            return "AVAILABLE" if code == 250 else "NOT_FOUND"
-    except: return "UNVERIFIABLE"
-
-def process_row(email):
-    email = str(email).strip()
+        return validate_email(f"postmaster@{domain}", check_deliverability=False).domain
+    except EmailNotValidError:
+        return None
+
+def process_row(email, dns_data, smtp_stat):
+    if dns_data is None:
+        return [email, "FAIL", "INVALID", "FAIL", "FAIL", "FAIL", "Syntax Error", "N/A", "Check Format"]
+    return [
+        email, dns_data["spf"], smtp_stat, dns_data["dkim"], 
+        dns_data["dmarc"], dns_data["mx"], "Valid Format", 
+        dns_data["server"], dns_data["dkim_report"]
+    ]
+
+def score_results(res_df):
+    """Scores every row at once from the audit columns."""
+    score = (
+        res_df["MX"].eq("PASS") * 20
+        + res_df["SPF"].eq("PASS") * 10
+        + res_df["DKIM"].str.contains("PASS", regex=False) * 10
+        + res_df["DMARC"].eq("PASS") * 10
+        + res_df["SMTP"].map({"AVAILABLE": 50, "PROTECTED": 40}).fillna(0)
+        - res_df["EMAIL"].str[:1].str.isdigit() * 30  # local part starts with a digit
+    )
+    return score.clip(lower=0).astype(int)
+
+def color_score(scores):
+    return np.select(
+        [scores >= 70, scores > 0],
+        ['background-color: #d4edda; color: #155724', 'background-color: #fff3cd; color: #856404'],
+        'background-color: #f8d7da; color: #721c24',
+    )
+
+def to_parquet_bytes(res_df):
+    # Arrow writes column-wise and compresses, so this is much cheaper than CSV.
+    report = io.BytesIO()
+    res_df.to_parquet(report, engine="pyarrow", compression="zstd", index=False)
+    return report.getvalue()
+
+def run_audit(file_bytes):
+    """Audits every email in an uploaded CSV.
+
+    Cached on the file contents, so reruns of the script don't repeat any
+    DNS/SMTP work until a different file is uploaded. A run that hit a DNS
+    timeout or an unreachable SMTP host isn't cached, so running it again
+    retries those.
+    """
     try:
-        valid = validate_email(email, check_deliverability=False)
-        dom = valid.domain
-        dns_data = get_dns_data(dom)
-        smtp_stat = check_smtp(email, dom, dns_data["server"])
-        
-        score = 0
-        if dns_data["mx"] == "PASS": score += 20
-        if dns_data["spf"] == "PASS": score += 10
-        if "PASS" in dns_data["dkim"]: score += 10
-        if dns_data["dmarc"] == "PASS": score += 10
-        if smtp_stat == "AVAILABLE": score += 50
-        elif smtp_stat == "PROTECTED": score += 40 
-        if re.match(r'^\d+', email.split('@')[0]): score -= 30
-        
-        return [
-            email, dns_data["spf"], smtp_stat, dns_data["dkim"], 
-            dns_data["dmarc"], dns_data["mx"], "Valid Format", 
-            dns_data["server"], dns_data["dkim_report"], max(0, score)
-        ]
-    except Exception:
-        return [email, "FAIL", "INVALID", "FAIL", "FAIL", "FAIL", "Syntax Error", "N/A", "Check Format", 0]
-
-def color_score(val):
-    if val >= 70: return 'background-color: #d4edda; color: #155724'
-    elif val > 0: return 'background-color: #fff3cd; color: #856404'
-    else: return 'background-color: #f8d7da; color: #721c24'
+        return _run_audit(file_bytes)
+    except Transient as e:
+        return e.result
+
+# Each entry is a whole report, so keep only a few recent files, and only for
+# a while: mailbox and DNS state go stale too.
+@st.cache_data(show_spinner=False, max_entries=8, ttl="1h")
+def _run_audit(file_bytes):
+    df = pd.read_csv(io.BytesIO(file_bytes), usecols=[0], dtype="string", engine="c")
+    emails = df.iloc[:, 0].dropna().str.strip()
+
+    well_formed = emails.str.match(EMAIL_RE)
+    raw_domains = emails.str.rpartition('@', expand=False).str[2].str.lower()
+    pairs = [
+        (e, validate_domain(d) if ok else None)
+        for e, d, ok in zip(emails, raw_domains, well_formed)
+    ]
+    # DNS answers are per domain: audit each unique domain once, then join back.
+    by_domain = defaultdict(list)
+    for e, dom in pairs:
+        if dom: by_domain[dom].append(e)
+
+    # DNS and SMTP run as one pipeline: as soon as a domain's DNS audit lands,
+    # its addresses are queued on their MX host. Each host gets one SMTP
+    # session at a time; addresses that arrive while it is busy go into the
+    # next session.
+    dns_table, smtp_table = {}, {}
+    queued = defaultdict(list)
+    busy = set()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        running = {executor.submit(get_dns_data, dom): ("dns", dom) for dom in by_domain}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = running.pop(future)
+                if stage == "dns":
+                    dns_data = dns_table[key] = future.result()
+                    queued[dns_data["mx_host"], dns_data["server"]].extend(by_domain[key])
+                else:
+                    smtp_table.update(future.result())
+                    busy.discard(key)
+            for host in [h for h in queued if h not in busy]:
+                running[executor.submit(check_smtp, queued.pop(host), *host)] = ("smtp", host)
+                busy.add(host)
+
+    results = [process_row(e, dns_table.get(dom), smtp_table.get(e)) for e, dom in pairs]
+
+    cols = ["EMAIL", "SPF", "SMTP", "DKIM", "DMARC", "MX", "STATUS", "SERVER", "DKIM_REPORT"]
+    res_df = pd.DataFrame(results, columns=cols)
+    res_df["SCORE"] = score_results(res_df)
+    # st.cache_data doesn't store a call that raised.
+    if any(
+        dns_data["transient"]
+        or (dns_data["mx_host"] and any(smtp_table[e] == "UNVERIFIABLE" for e in by_domain[dom]))
+        for dom, dns_data in dns_table.items()
+    ):
+        raise Transient(res_df)
+    return res_df
 
 # --- UI INTERFACE ---
 st.title("📧 Mailmeter Pro: Ultimate Accuracy Audit")
 uploaded_file = st.file_uploader("Upload CSV", type="csv")
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file)
-    emails = df.iloc[:, 0].dropna().astype(str).tolist()
-    
     if st.button("🚀 Run Deep Audit", type="primary"):
         with st.spinner("Analyzing DNS and Brute-Forcing Selectors..."):
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                results = list(executor.map(process_row, emails))
-        
-        cols = ["EMAIL", "SPF", "SMTP", "DKIM", "DMARC", "MX", "STATUS", "SERVER", "DKIM_REPORT", "SCORE"]
-        res_df = pd.DataFrame(results, columns=cols)
+            res_df = run_audit(uploaded_file.getvalue())
         
         st.success(f"✅ Audit Complete!")
-        st.dataframe(res_df.style.applymap(color_score, subset=['SCORE']), use_container_width=True)
+        st.dataframe(res_df.style.apply(color_score, subset=['SCORE']), use_container_width=True)
 
         st.divider()
-        st.download_button("📥 Download Full Report", res_df.to_csv(index=False), "full_report.csv", "text/csv")
+        # The files are only built when a button is clicked; "ignore" skips the
+        # rerun, which would otherwise clear the results (and the pending file).
+        st.download_button("📥 Download Full Report", partial(to_parquet_bytes, res_df), "full_report.parquet", "application/vnd.apache.parquet", on_click="ignore")
+        st.download_button("📄 Download as CSV", partial(res_df.to_csv, index=False), "full_report.csv", "text/csv", on_click="ignore")
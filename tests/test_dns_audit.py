@@ -0,0 +1,209 @@
+import socket
+import threading
+import time
+import unittest
+from unittest import mock
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.resolver
+import dns.rrset
+
+import dns_audit
+
+
+LIFETIME = 1.0
+DKIM_RECORD = '"v=DKIM1; p=abc"'
+
+
+def reply(query, rcode=dns.rcode.NXDOMAIN, txt=None):
+    response = dns.message.make_response(query)
+    response.set_rcode(rcode)
+    if txt is not None:
+        response.answer.append(
+            dns.rrset.from_text(query.question[0].name, 300, "IN", "TXT", txt)
+        )
+    return response
+
+
+class FakeNameserver:
+    """A UDP (and optionally TCP) nameserver on a loopback address.
+
+    `handler(query, attempt)` returns the messages to send back for the
+    attempt-th copy of a query (counted per question name).
+    """
+
+    def __init__(self, address, port, handler, tcp_handler=None):
+        self.handler = handler
+        self.tcp_handler = tcp_handler
+        self.attempts = {}
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind((address, port))
+        self.udp.settimeout(0.05)
+        self.port = self.udp.getsockname()[1]
+        self.tcp = None
+        if tcp_handler:
+            self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.tcp.bind((address, self.port))
+            self.tcp.listen()
+            self.tcp.settimeout(0.05)
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=self._serve_udp, daemon=True)]
+        if self.tcp:
+            self.threads.append(threading.Thread(target=self._serve_tcp, daemon=True))
+        for t in self.threads:
+            t.start()
+
+    @property
+    def received(self):
+        return sum(self.attempts.values())
+
+    def _serve_udp(self):
+        while not self.stopped.is_set():
+            try:
+                wire, peer = self.udp.recvfrom(65535)
+            except socket.timeout:
+                continue
+            query = dns.message.from_wire(wire)
+            name = query.question[0].name
+            attempt = self.attempts[name] = self.attempts.get(name, 0) + 1
+            for response in self.handler(query, attempt):
+                self.udp.sendto(response.to_wire(), peer)
+
+    def _serve_tcp(self):
+        while not self.stopped.is_set():
+            try:
+                conn, _ = self.tcp.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                query, _ = dns.query.receive_tcp(conn, expiration=time.time() + 1)
+                dns.query.send_tcp(conn, self.tcp_handler(query))
+
+    def close(self):
+        self.stopped.set()
+        for t in self.threads:
+            t.join()
+        self.udp.close()
+        if self.tcp:
+            self.tcp.close()
+
+
+class ScanDkimTest(unittest.TestCase):
+    def serve(self, *handlers, tcp_handler=None):
+        """Starts one fake nameserver per handler, on 127.0.0.1, 127.0.0.2, ...
+        sharing one port, and points the shared resolver at them."""
+        servers, port = [], 0
+        for n, handler in enumerate(handlers, start=1):
+            server = FakeNameserver(f"127.0.0.{n}", port, handler, tcp_handler if n == 1 else None)
+            self.addCleanup(server.close)
+            servers.append(server)
+            port = server.port
+        resolver = dns.resolver.Resolver(configure=False)
+        resolver.nameservers = [f"127.0.0.{n}" for n in range(1, len(handlers) + 1)]
+        resolver.port = port
+        resolver.lifetime = LIFETIME
+        patcher = mock.patch.object(dns_audit, "_RESOLVER", resolver)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return servers
+
+    def scan(self, domain="example.com"):
+        started = time.monotonic()
+        answers = dns_audit.scan_dkim(domain)
+        return answers, time.monotonic() - started
+
+    def assert_only_google(self, answers):
+        google = dns_audit.ULTIMATE_SELECTORS.index("google")
+        self.assertEqual([a.to_text() for a in answers[google]], [DKIM_RECORD])
+        self.assertEqual(answers[:google] + answers[google + 1:], [None] * (len(answers) - 1))
+
+    @staticmethod
+    def google_has_dkim(query, attempt):
+        if query.question[0].name.labels[0] == b"google":
+            return [reply(query, dns.rcode.NOERROR, DKIM_RECORD)]
+        return [reply(query)]
+
+    def test_answers_are_matched_to_selectors(self):
+        self.serve(self.google_has_dkim)
+        answers, _ = self.scan()
+        self.assert_only_google(answers)
+
+    def test_refused_falls_back_to_next_nameserver(self):
+        refused, good = self.serve(
+            lambda q, n: [reply(q, dns.rcode.REFUSED)], self.google_has_dkim
+        )
+        answers, elapsed = self.scan()
+        self.assert_only_google(answers)
+        self.assertEqual(good.received, len(dns_audit.ULTIMATE_SELECTORS))
+        # Every query was refused outright, so there was no reason to wait.
+        self.assertLess(elapsed, LIFETIME / 2)
+
+    def test_servfail_everywhere_is_an_error(self):
+        self.serve(
+            lambda q, n: [reply(q, dns.rcode.SERVFAIL)],
+            lambda q, n: [reply(q, dns.rcode.REFUSED)],
+        )
+        answers, _ = self.scan()
+        for answer in answers:
+            self.assertIsInstance(answer, dns.resolver.NoNameservers)
+
+    def test_silent_nameserver_falls_back_after_its_share(self):
+        silent, good = self.serve(lambda q, n: [], self.google_has_dkim)
+        answers, elapsed = self.scan()
+        self.assert_only_google(answers)
+        self.assertGreaterEqual(elapsed, LIFETIME / 2)
+        # Each query was sent to the silent server once more at half its share.
+        self.assertEqual(silent.received, 2 * len(dns_audit.ULTIMATE_SELECTORS))
+
+    def test_no_reply_at_all_times_out(self):
+        self.serve(lambda q, n: [])
+        answers, elapsed = self.scan()
+        self.assertGreaterEqual(elapsed, LIFETIME)
+        self.assertLess(elapsed, LIFETIME + 0.5)
+        for answer in answers:
+            self.assertIsInstance(answer, dns.resolver.LifetimeTimeout)
+
+    def test_lost_reply_is_resent(self):
+        self.serve(lambda q, n: [] if n == 1 else self.google_has_dkim(q, n))
+        answers, _ = self.scan()
+        self.assert_only_google(answers)
+
+    def test_truncated_reply_is_retried_over_tcp(self):
+        def truncated(query, attempt):
+            response = reply(query, dns.rcode.NOERROR)
+            response.flags |= dns.flags.TC
+            return [response]
+
+        self.serve(truncated, tcp_handler=lambda q: self.google_has_dkim(q, 1)[0])
+        answers, _ = self.scan()
+        self.assert_only_google(answers)
+
+    def test_mismatched_replies_are_ignored(self):
+        def forged_first(query, attempt):
+            wrong_id = reply(query, dns.rcode.NOERROR, '"forged"')
+            wrong_id.id = query.id ^ 0x8000
+            wrong_question = reply(
+                dns.message.make_query("other.example.", "TXT"), dns.rcode.NOERROR, '"forged"'
+            )
+            wrong_question.id = query.id
+            return [wrong_id, wrong_question] + self.google_has_dkim(query, attempt)
+
+        self.serve(forged_first)
+        answers, _ = self.scan()
+        self.assert_only_google(answers)
+
+    def test_invalid_name_is_an_error_per_selector(self):
+        silent, = self.serve(lambda q, n: [])
+        answers, elapsed = self.scan("foo..bar.com")
+        for answer in answers:
+            self.assertIsInstance(answer, dns.name.EmptyLabel)
+        self.assertEqual(silent.received, 0)
+        self.assertLess(elapsed, LIFETIME / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mailmeter_csv
+
+
+# Both pass EMAIL_RE but are not valid DNS names.
+EMPTY_LABEL = "x@foo..bar.com"
+LONG_LABEL = "y@" + "a" * 64 + ".com"
+
+
+class LookupDkimTest(unittest.TestCase):
+    def setUp(self):
+        mailmeter_csv.lookup_dkim.cache_clear()
+
+    def test_invalid_name_is_reported_not_raised(self):
+        self.assertEqual(
+            mailmeter_csv.lookup_dkim("foo..bar.com"), ("FAIL", "Error: EmptyLabel")
+        )
+        self.assertEqual(
+            mailmeter_csv.lookup_dkim("a" * 64 + ".com"), ("FAIL", "Error: LabelTooLong")
+        )
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        mailmeter_csv.lookup_dkim.cache_clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.input = os.path.join(self.tmp.name, "in.csv")
+        self.output = os.path.join(self.tmp.name, "out.csv")
+        for name, path in (("INPUT_FILE", self.input), ("OUTPUT_FILE", self.output)):
+            patcher = mock.patch.object(mailmeter_csv, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bad_row_does_not_abort_the_run(self):
+        with open(self.input, "w", newline="") as f:
+            f.write(f"email\n{EMPTY_LABEL}\n{LONG_LABEL}\nnot-an-email\n")
+        with mock.patch("builtins.print"):
+            mailmeter_csv.main()
+        with open(self.output, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(
+            [(r["EMAIL"], r["DKIM_STATUS"], r["DKIM_REPORT"]) for r in rows],
+            [
+                (EMPTY_LABEL, "FAIL", "Error: EmptyLabel"),
+                (LONG_LABEL, "FAIL", "Error: LabelTooLong"),
+                ("not-an-email", "FAIL", "Invalid Email Format"),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()